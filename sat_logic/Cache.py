@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+class FormulaDigest:
+    # order-independent hash of a clause set that can be updated one clause at a time
+    def __init__(self, clauses=()):
+        self.clauses = set()
+        self.max_var = 0
+        self.value = 0
+        for clause in clauses:
+            self.add(clause)
+
+    def add(self, clause) -> None:
+        clause = tuple(sorted({int(literal) for literal in clause}))
+        if clause in self.clauses:
+            return
+        self.clauses.add(clause)
+        if clause:
+            self.max_var = max(self.max_var, abs(clause[0]), abs(clause[-1]))
+        digest = hashlib.sha256(repr(clause).encode("utf-8")).digest()
+        self.value = (self.value + int.from_bytes(digest, "big")) % (1 << 256)
+
+    def hexdigest(self) -> str:
+        return format(self.value, "064x")
+
+
+class ResultCache:
+    # temporary files older than this are leftovers of a crash, not another process's write in flight
+    stale_tmp_seconds = 3600
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024, memory_entries: int = 1024, memory_bytes: int = 16 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # evicting below the budget means a full directory scan only every so many puts
+        self.low_water = max_bytes * 3 // 4
+        self.memory_entries = memory_entries
+        self.memory_bytes = memory_bytes
+        self.memory = OrderedDict()  # key -> (value, serialized size)
+        self.memory_used = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith(".tmp"):
+                path = os.path.join(directory, name)
+                try:
+                    if os.stat(path).st_mtime < time.time() - ResultCache.stale_tmp_seconds:
+                        os.remove(path)
+                except OSError:
+                    pass
+        self.disk_bytes = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def canonical(clauses) -> list[list[int]]:
+        # clause and literal order, duplicate clauses and the Literal/int distinction don't matter
+        return [list(clause) for clause in sorted({tuple(sorted(int(literal) for literal in clause)) for clause in clauses})]
+
+    @staticmethod
+    def key(*parts) -> str:
+        return hashlib.sha256(json.dumps(parts, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        path = self._path(key)
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+        if entry is not None:
+            value = entry[0]
+        else:
+            try:
+                with open(path, "rb") as entry_file:
+                    data = entry_file.read()
+                value = json.loads(data)
+            except (OSError, ValueError):
+                return None
+            self._remember(key, value, len(data))
+        try:
+            os.utime(path)  # mtime is the recency used for eviction
+        except OSError:
+            pass
+        return value
+
+    def put(self, key: str, value) -> None:
+        # the result is already computed, so a store that can't be written only means a later miss
+        data = json.dumps(value, separators=(",", ":")).encode("utf-8")
+        self._remember(key, value, len(data))
+        path = self._path(key)
+        tmp_name = None
+        try:
+            fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as entry_file:
+                entry_file.write(data)
+            with self.lock:
+                try:
+                    old_size = os.stat(path).st_size
+                except OSError:
+                    old_size = 0
+                os.replace(tmp_name, path)
+                tmp_name = None
+                self.disk_bytes += len(data) - old_size
+                if self.disk_bytes > self.max_bytes:
+                    self._evict()
+        except OSError:
+            if tmp_name is not None:
+                try:
+                    os.remove(tmp_name)
+                except OSError:
+                    pass
+
+    def clear(self) -> None:
+        with self.lock:
+            self.memory.clear()
+            self.memory_used = 0
+            for path, _, _ in self._entries():
+                os.remove(path)
+            self.disk_bytes = 0
+
+    def _remember(self, key, value, size):
+        with self.lock:
+            if key in self.memory:
+                self.memory_used -= self.memory.pop(key)[1]
+            # entries too large for the memory tier (big models or interpolants) are served from disk
+            if size > self.memory_bytes // 16:
+                return
+            self.memory[key] = (value, size)
+            self.memory_used += size
+            while len(self.memory) > self.memory_entries or self.memory_used > self.memory_bytes:
+                self.memory_used -= self.memory.popitem(last=False)[1][1]
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self.disk_bytes = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self.disk_bytes <= self.low_water:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.disk_bytes -= size
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+
+active = None
+
+def enable(directory: str = os.path.join(os.path.expanduser("~"), ".cache", "sat_logic"), max_bytes: int = 64 * 1024 * 1024, memory_entries: int = 1024, memory_bytes: int = 16 * 1024 * 1024) -> ResultCache:
+    global active
+    active = ResultCache(directory, max_bytes, memory_entries, memory_bytes)
+    return active
+
+def disable() -> None:
+    global active
+    active = None
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResultCache(directory, max_bytes=35, memory_entries=8)
+        for _ in range(5):
+            cache.put("a", {"result": 10})  # rewriting a key replaces its size
+        sizes_ok = cache.disk_bytes == os.path.getsize(cache._path("a"))
+        os.utime(cache._path("a"), (0, 0))
+        cache.put("b", {"result": 20})
+        os.utime(cache._path("b"), (1, 1))
+        for _ in range(5):
+            cache.get("a")  # memory-tier hits still refresh the disk recency
+        cache.put("c", {"result": 10})
+        kept = sorted(name for name in os.listdir(directory))
+    if sizes_ok and kept == ["a.json", "c.json"]:
+        print("ResultCache LRU [PASS]")
+    else:
+        print("ResultCache LRU [FAIL]")
+        print(f'Expected: [\'a.json\', \'c.json\']')
+        print(f'Actual:   {kept}')
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResultCache(directory, memory_bytes=16 * 64)
+        cache.put("small", {"result": 10})
+        cache.put("large", {"result": 10, "model": list(range(100))})  # over 1/16 of the memory tier
+        memory_ok = list(cache.memory) == ["small"] and cache.get("large") is not None
+        for index in range(100):
+            cache.put(str(index), {"result": 20})
+        memory_ok = memory_ok and cache.memory_used <= cache.memory_bytes
+        # a failing write (here: the directory is gone) must not raise out of put
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+        try:
+            cache.put("lost", {"result": 10})
+            write_ok = cache.get("lost") is not None
+        except OSError:
+            write_ok = False
+        finally:
+            os.makedirs(directory, exist_ok=True)
+    if memory_ok and write_ok:
+        print("ResultCache limits [PASS]")
+    else:
+        print("ResultCache limits [FAIL]")
+
+    if FormulaDigest([[2, 3], [-2]]).hexdigest() == FormulaDigest([[-2], [3, 2], [2, 3]]).hexdigest():
+        print("FormulaDigest [PASS]")
+    else:
+        print("FormulaDigest [FAIL]")
@@ -1,15 +1,22 @@
 try:
+    from sat_logic import Cache
     from sat_logic.ColoredLogic import ColorfulCNF
     from sat_logic.Logic import CNF, Clause
-    from sat_logic.Solvers import ProofSolver, SAT
+    from sat_logic.Solvers import ProofSolver, SolveRequest, SolverPool, SAT, UNSAT
 except ModuleNotFoundError:
+    import Cache
     from ColoredLogic import ColorfulCNF
     from Logic import CNF, Clause
-    from Solvers import ProofSolver, SAT
+    from Solvers import ProofSolver, SolveRequest, SolverPool, SAT, UNSAT
+import os
+import tempfile
 
 class SATException(Exception):
     pass
 
+class UnknownException(Exception):
+    pass
+
 class LabeledClause:
     def __init__(self, clause: Clause, label: CNF, index: int) -> None:
         self.clause = clause
@@ -26,25 +33,69 @@ class ProofClause(LabeledClause):
         self.label = None
 
 class Interpolant:
+    # When the result comes from the result cache only `cnf` is available:
+    # no proof is replayed, so `solver` is None and `proof_clauses` carries no labels.
     def __init__(self, colorful_cnf: ColorfulCNF) -> None:
+        self._compute(colorful_cnf)
+
+    def _compute(self, colorful_cnf: ColorfulCNF, solver: ProofSolver = None, request: SolveRequest = None) -> None:
+        self.solver = None
         self.colorful_cnf = colorful_cnf
         self.proof_clauses = list(colorful_cnf)
         self.proof_clauses.insert(0, Clause(1)) # Constant true
         self.color_variables = colorful_cnf.color[1].variables
 
-        self.solver = ProofSolver()
-        self.solver.add_formula(self.proof_clauses)
-        if self.solver.solve() == SAT:
+        cache = Cache.active
+        if cache is not None:
+            key = Cache.ResultCache.key(
+                "interpolant",
+                [Cache.FormulaDigest(cnf).hexdigest() for cnf in colorful_cnf.color])
+            cached = cache.get(key)
+            if cached is not None:
+                if cached["result"] == SAT:
+                    raise SATException("Formula is SAT")
+                label = CNF([Clause(clause) for clause in cached["interpolant"]])
+                label.keep_minimal = True
+                self.last_step = LabeledClause(Clause(), label, 0)
+                return
+
+        self.solver = solver if solver is not None else ProofSolver()
+        if request is None or not request.terminate_requested:
+            self.solver.add_formula(self.proof_clauses)
+        ret = self.solver.solve(request=request)
+        if ret == SAT:
+            if cache is not None:
+                cache.put(key, {"result": SAT})
             raise SATException("Formula is SAT")
+        if ret != UNSAT:
+            raise UnknownException("Solver was terminated")
         self.proof_clauses.insert(0, Clause())  # Shift the clauses by 1
 
-        with open("proof.lrat", "r") as proof_file:
+        with open(self.solver.proof_name, "r") as proof_file:
             for line in proof_file:
                 if line.split()[1] != "d":
                     self.last_step = ProofClause(line)
                     self.proof_clauses.insert(self.last_step.index, self.last_step)
                     self.proof_clauses[self.last_step.index].label = self.getLabel(self.last_step.index)
 
+        if cache is not None:
+            cache.put(key, {"result": UNSAT, "interpolant": Cache.ResultCache.canonical(self.cnf)})
+
+    @staticmethod
+    async def compute_async(colorful_cnf: ColorfulCNF, pool: SolverPool = None):
+        # each job traces to its own proof file so concurrent jobs don't clobber each other
+        fd, proof_name = tempfile.mkstemp(suffix=".lrat")
+        os.close(fd)
+        try:
+            solver = ProofSolver(proof_name)
+            request = SolveRequest()
+            interpolant = Interpolant.__new__(Interpolant)
+            pool = pool if pool is not None else SolverPool.default()
+            await pool.run(interpolant._compute, colorful_cnf, solver, request, cancel=lambda: solver.terminate(request))
+            return interpolant
+        finally:
+            os.remove(proof_name)
+
     @property
     def cnf(self):
         return self.last_step.label
@@ -94,3 +145,26 @@ if __name__ == "__main__":
         print("Interpolant [FAIL]")
         print(f'Expected: (¬3) ∧ (5)')
         print(f'Actual:   {clauses}')
+
+    import asyncio
+    async def check_compute_async():
+        interpolants = await asyncio.gather(*(Interpolant.compute_async(ccnf) for _ in range(4)))
+        return all(interpolant.cnf == clauses for interpolant in interpolants)
+
+    if asyncio.run(check_compute_async()):
+        print("Interpolant.compute_async [PASS]")
+    else:
+        print("Interpolant.compute_async [FAIL]")
+
+    with tempfile.TemporaryDirectory() as directory:
+        Cache.enable(directory)
+        computed = Interpolant(ccnf)
+        Cache.active.memory.clear()  # force the second lookup through the disk tier
+        cached = Interpolant(ccnf)
+        Cache.disable()
+    if computed.cnf == clauses and cached.cnf == clauses and computed.solver is not None and cached.solver is None:
+        print("Interpolant cache [PASS]")
+    else:
+        print("Interpolant cache [FAIL]")
+        print(f'Expected: {clauses}')
+        print(f'Actual:   {computed.cnf} / {cached.cnf}')
@@ -1,14 +1,31 @@
+import asyncio
 import ctypes
 import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 try:
+    from sat_logic import Cache
     from sat_logic.Logic import CNF, Clause, Literal
 except ModuleNotFoundError:
+    import Cache
     from Logic import CNF, Clause, Literal
 
+UNKNOWN = 0
 SAT = 10
 UNSAT = 20
 
 
+class ModelException(Exception):
+    pass
+
+
+class SolveRequest:
+    # cancellation handle for one solve; a termination requested before the solve starts is not lost
+    def __init__(self):
+        self.terminate_requested = False
+
+
 class Cadical:
     lib = ctypes.cdll.LoadLibrary(os.path.join(os.path.dirname(__file__), "bin/ccadical.so"))
     lib.ccadical_init.argtypes = []
@@ -29,12 +46,29 @@ class Cadical:
     lib.ccadical_release.restype = None
     lib.ccadical_constrain.argtypes = [ctypes.c_void_p, ctypes.c_int]
     lib.ccadical_constrain.restype = None
+    lib.ccadical_terminate.argtypes = [ctypes.c_void_p]
+    lib.ccadical_terminate.restype = None
+    lib.ccadical_val.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    lib.ccadical_val.restype = ctypes.c_int
 
     def __init__(self):
         self.solver = Cadical.lib.ccadical_init()
         self.proof_filename = None
+        # one constrain/assume/solve/val sequence at a time on the native handle
+        self.solve_lock = threading.RLock()
+        # ccadical_terminate only resets at the end of a solve, so it must not be called outside one
+        self.solving = None
+        self.solving_lock = threading.Lock()
+        # digest of the formula and the options, kept only while the result cache is enabled
+        self.formula = Cache.FormulaDigest() if Cache.active is not None else None
+        self.pending = []
+        self.options = {}
+        # model served by val() after a result that came from the cache
+        self.from_cache = False
+        self.model = None
 
     def set_option(self, option:str, value:int) -> bool:
+        self.options[option] = int(value)
         return Cadical.lib.ccadical_set_option(self.solver, option.encode('utf-8'), value)
     
     def trace_proof(self, proof_filename) -> bool:
@@ -42,9 +76,17 @@ class Cadical:
         return Cadical.lib.ccadical_trace_proof(self.solver, proof_filename.encode('utf-8'))
         
     def add_literal(self, literal:Literal) -> None:
+        if self.formula is not None:
+            if int(literal) == 0:
+                self.formula.add(self.pending)
+                self.pending = []
+            else:
+                self.pending.append(int(literal))
         Cadical.lib.ccadical_add(self.solver, int(literal))
 
     def add_clause(self, clause:Clause) -> None:
+        if self.formula is not None:
+            self.formula.add(clause)
         for literal in clause:
             Cadical.lib.ccadical_add(self.solver, int(literal))
         Cadical.lib.ccadical_add(self.solver, 0)
@@ -53,7 +95,31 @@ class Cadical:
         for clause in formula:
             self.add_clause(clause)
 
-    def solve(self, assumptions: list[Literal]=[], constraint: Clause = None):
+    def solve(self, assumptions: list[Literal]=[], constraint: Clause = None, request: SolveRequest = None):
+        request = request if request is not None else SolveRequest()
+        with self.solve_lock:
+            return self._solve(assumptions, constraint, request)
+
+    def _solve(self, assumptions, constraint, request):
+        self.from_cache = False
+        self.model = None
+        if request.terminate_requested:
+            return UNKNOWN
+        # a proof can't be replayed from the cache, so traced solves always run
+        cache = Cache.active if self.proof_filename is None and self.formula is not None else None
+        if cache is not None:
+            key = Cache.ResultCache.key(
+                "solve",
+                self.formula.hexdigest(),
+                sorted({int(lit) for lit in assumptions}),
+                sorted({int(lit) for lit in constraint}) if constraint else None,
+                sorted(self.options.items()))
+            cached = cache.get(key)
+            if cached is not None:
+                self.from_cache = True
+                self.model = cached.get("model")
+                return cached["result"]
+
         if constraint:
             for literal in constraint:
                 Cadical.lib.ccadical_constrain(self.solver, int(literal))
@@ -62,14 +128,98 @@ class Cadical:
         for lit in assumptions:
             Cadical.lib.ccadical_assume(self.solver, int(lit))
 
-        ret = Cadical.lib.ccadical_solve(self.solver)
+        with self.solving_lock:
+            self.solving = request
+            if request.terminate_requested:
+                # still has to go through ccadical_solve so the assumptions are consumed
+                Cadical.lib.ccadical_terminate(self.solver)
+        try:
+            ret = Cadical.lib.ccadical_solve(self.solver)
+        finally:
+            with self.solving_lock:
+                self.solving = None
         if ret == 20 and self.proof_filename is not None:
             Cadical.lib.ccadical_flush_proof_trace(self.solver)
+        if cache is not None and ret == SAT:
+            max_var = max([self.formula.max_var] + [abs(int(lit)) for lit in assumptions] + [abs(int(lit)) for lit in constraint or []])
+            cache.put(key, {"result": ret, "model": [self.val(var) for var in range(1, max_var + 1)]})
+        elif cache is not None and ret == UNSAT:
+            cache.put(key, {"result": ret})
         return ret
+
+    def val(self, literal:Literal) -> int:
+        # after SAT: the literal if it is true in the model, its negation otherwise
+        if self.from_cache and self.model is None:
+            # the native solver never ran, and CaDiCaL aborts on val outside the SAT state
+            raise ModelException("No model: the last result came from the cache without one")
+        if self.model is None:
+            with self.solve_lock:
+                return Cadical.lib.ccadical_val(self.solver, int(literal))
+        variable = abs(int(literal))
+        value = self.model[variable - 1] if variable <= len(self.model) else -variable
+        return int(literal) if (value > 0) == (int(literal) > 0) else -int(literal)
+
+    async def solve_async(self, assumptions: list[Literal]=[], constraint: Clause = None, pool=None):
+        # cancelling the awaiting task terminates the native solve, which then returns UNKNOWN
+        pool = pool if pool is not None else SolverPool.default()
+        request = SolveRequest()
+        return await pool.run(self.solve, assumptions, constraint, request, cancel=lambda: self.terminate(request))
+
+    def terminate(self, request: SolveRequest = None) -> None:
+        # safe to call from another thread. Without a request only a running solve is interrupted;
+        # with one, that request's solve is interrupted whether it is running or still to come.
+        with self.solving_lock:
+            if request is not None:
+                request.terminate_requested = True
+            if self.solving is not None and (request is None or self.solving is request):
+                Cadical.lib.ccadical_terminate(self.solver)
     
     def __del__(self):
         Cadical.lib.ccadical_release(self.solver)
 
+
+class SolverPool:
+    _default = None
+
+    def __init__(self, max_workers: int = None):
+        # ctypes releases the GIL during native calls, so solves run in parallel on threads
+        self.max_workers = max_workers if max_workers is not None else min(32, (os.cpu_count() or 1) + 4)
+        self.executor = ThreadPoolExecutor(self.max_workers)
+        # bounds in-flight jobs: callers wait here instead of queueing inside the executor.
+        # A semaphore is bound to one event loop, so each loop using the pool gets its own.
+        self.slots = weakref.WeakKeyDictionary()
+        self.slots_lock = threading.Lock()
+
+    @staticmethod
+    def default():
+        if SolverPool._default is None:
+            SolverPool._default = SolverPool()
+        return SolverPool._default
+
+    def _slots(self):
+        loop = asyncio.get_running_loop()
+        with self.slots_lock:
+            if loop not in self.slots:
+                self.slots[loop] = asyncio.Semaphore(self.max_workers)
+            return self.slots[loop]
+
+    async def run(self, function, *args, cancel=None):
+        async with self._slots():
+            future = asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if cancel is not None:
+                    cancel()
+                # keep the slot (and the solver) until the worker has actually returned
+                await asyncio.wait([future])
+                if not future.cancelled():
+                    future.exception()
+                raise
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
 from enum import Enum
 class ProofType(Enum):
     LRAT = "lrat"
@@ -82,6 +232,7 @@ class ProofSolver:
         self.solver.set_option(proof_type.value, True)
         self.solver.set_option("binary", proof_binary)
         self.solver.trace_proof(proof_name)
+        self.proof_name = proof_name
         
         self.clauses = [None]
 
@@ -93,15 +244,23 @@ class ProofSolver:
         for clause in formula:
             self.add_clause(clause)
 
-    def solve(self, assumptions: list[int] = [], constraint: Clause = None):
+    def solve(self, assumptions: list[int] = [], constraint: Clause = None, request: SolveRequest = None):
         self.last_assumptions = assumptions
         self.last_constraint = constraint
 
-        ret = self.solver.solve(assumptions, constraint)
+        ret = self.solver.solve(assumptions, constraint, request)
         # if assumptions or constraints are used, the proof doesn't end with 0
         # we have to finish with the last clause
         return ret
 
+    async def solve_async(self, assumptions: list[int] = [], constraint: Clause = None, pool=None):
+        self.last_assumptions = assumptions
+        self.last_constraint = constraint
+        return await self.solver.solve_async(assumptions, constraint, pool)
+
+    def terminate(self, request: SolveRequest = None):
+        self.solver.terminate(request)
+
     @staticmethod
     def implies(hypothesis, conclusion):
         # (hypothesis -> conclusion) == ~hypothesis | conclusion == ~(hypothesis & ~conclusion)
@@ -112,10 +271,91 @@ class ProofSolver:
 
 
 if __name__ == "__main__":
+    import tempfile
+    import time
+
+    def pigeonhole(holes: int) -> CNF:
+        # holes + 1 pigeons into holes holes: UNSAT and hard enough to still be running when cancelled
+        var = lambda pigeon, hole: 2 + pigeon * holes + hole
+        clauses = [[var(p, h) for h in range(holes)] for p in range(holes + 1)]
+        clauses += [[-var(p, h), -var(q, h)] for h in range(holes) for p in range(holes + 1) for q in range(p + 1, holes + 1)]
+        return CNF(clauses)
+
     solver = ProofSolver()
     
     solver.add_formula(CNF([[2,3], [2,-3],[-2,3],[-2,-3]]))
     solver.solve()
+
+    async def check_solve_async(pool):
+        solver = Cadical()
+        solver.add_formula(CNF([[2,3], [2,-3],[-2,3],[-2,-3]]))
+        results = await asyncio.gather(*(solver.solve_async([lit], pool=pool) for lit in (2, -2, 3, -3)))
+        return results == [UNSAT] * 4
+
+    # two event loops in a row sharing one saturated pool, then concurrent solves on one solver
+    pool = SolverPool(1)
+    if asyncio.run(check_solve_async(pool)) and asyncio.run(check_solve_async(pool)) and asyncio.run(check_solve_async(SolverPool(4))):
+        print("solve_async [PASS]")
+    else:
+        print("solve_async [FAIL]")
+
+    async def check_cancel(pool, delay):
+        solver = Cadical()
+        solver.add_formula(pigeonhole(11))
+        task = asyncio.ensure_future(solver.solve_async(pool=pool))
+        await asyncio.sleep(delay)
+        start = time.time()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return time.time() - start < 1
+        return False
+
+    # cancelled while solving, and cancelled before the worker has started the solve
+    if asyncio.run(check_cancel(pool, 0.2)) and asyncio.run(check_cancel(pool, 0)):
+        print("solve_async cancel [PASS]")
+    else:
+        print("solve_async cancel [FAIL]")
+
+    # val after an UNSAT cache hit raises instead of reaching the native solver
+    with tempfile.TemporaryDirectory() as directory:
+        Cache.enable(directory)
+        for _ in range(2):
+            solver = Cadical()
+            solver.add_formula(CNF([[2,3], [2,-3],[-2,3],[-2,-3]]))
+            solver.solve()
+        try:
+            solver.val(2)
+            print("val without model [FAIL]")
+        except ModelException:
+            print("val without model [PASS]")
+        Cache.disable()
+
+    # terminating an idle solver must not cut short the next solve
+    solver = Cadical()
+    solver.add_formula(CNF([[2,3], [2,-3],[-2,3],[-2,-3]]))
+    solver.solve()
+    solver.terminate()
+    if solver.solve() == UNSAT:
+        print("terminate when idle [PASS]")
+    else:
+        print("terminate when idle [FAIL]")
+
+    with tempfile.TemporaryDirectory() as directory:
+        Cache.enable(directory)
+        results = []
+        for clauses in ([[2, 3], [-2], [-3, 4]], [[-3, 4], [3, 2], [-2]]):  # same formula, reordered
+            solver = Cadical()
+            solver.add_formula(CNF(clauses))
+            results.append((solver.solve(), [solver.val(lit) for lit in (2, 3, 4, -4)], solver.model is not None))
+        implies = [ProofSolver.implies(CNF([[2], [3]]), CNF([[2, 3]])) for _ in range(2)]
+        Cache.disable()
+    if results == [(SAT, [-2, 3, 4, 4], False), (SAT, [-2, 3, 4, 4], True)] and implies == [True, True]:
+        print("solve cache [PASS]")
+    else:
+        print("solve cache [FAIL]")
+        print(f'Actual:   {results} {implies}')
     '''
     solver.add_formula(CNF([-2, -3, 4], [-2,-3,-4]))
     solver.solve(assumptions=[2,3])